@@ -14,13 +14,26 @@ __licence__ = "MIT"
 # Local imports.
 
 from build_taxa_lineage.build_taxa_line import (
+    annotate_dataframe,
     build_lineage,
     build_lineage_map,
+    clear_lineage_cache,
+    lineages_for,
+    load_lineage_cache,
+    save_lineage_cache,
 )
 
 ##############################################################################
 # Export the imports.
 
-__all__ = ["build_lineage", "build_lineage_map"]
+__all__ = [
+    "annotate_dataframe",
+    "build_lineage",
+    "build_lineage_map",
+    "clear_lineage_cache",
+    "lineages_for",
+    "load_lineage_cache",
+    "save_lineage_cache",
+]
 
 ### __init__.py ends here
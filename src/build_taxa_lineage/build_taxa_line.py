@@ -12,7 +12,12 @@ batch lineage mapping with memoization for performance.
 
 ```python
 import pandas as pd
-from build_taxa_lineage import build_lineage, build_lineage_map
+from build_taxa_lineage import (
+    annotate_dataframe,
+    build_lineage,
+    build_lineage_map,
+    lineages_for,
+)
 
 df = pd.read_csv("input.tsv", sep="\t")
 df["ncbi_tax_id"] = df["ncbi_tax_id"].fillna(-1).astype(int)
@@ -25,13 +30,35 @@ taxid_list = df["ncbi_tax_id"].unique().tolist()
 lineage_map = build_lineage_map(taxid_list)
 df["lineage"] = df["ncbi_tax_id"].map(lineage_map)
 
+# OR let annotate_dataframe do the unique -> map steps for you
+df = annotate_dataframe(df, col="ncbi_tax_id", out="lineage")
+
+# OR get the lineages as a NumPy array aligned with the column
+df["lineage"] = lineages_for(df["ncbi_tax_id"].to_numpy())
+
 df.to_csv("output.tsv", sep="\t", index=False)
+```
+
+## Example Usage (command line):
+
+```console
+build-taxa-lineage --in input.tsv --out output.tsv --col ncbi_tax_id
+```
 """
 
+import atexit
+import logging
+import os
+import pickle
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from ete4 import NCBITaxa
-from functools import lru_cache
+from threading import Lock, local
 from typing import Optional
 
+log = logging.getLogger(__name__)
+
 # Mapping from NCBI ranks to prefixes
 rank_prefix = {
     "domain": "d",
@@ -43,57 +70,415 @@ rank_prefix = {
     "species": "s",
 }
 
+# Precomputed "<prefix>__" strings and the space -> underscore table for names
+_PREFIX_SEP = {rank: f"{prefix}__" for rank, prefix in rank_prefix.items()}
+_SPACE_TABLE = str.maketrans({" ": "_"})
+
+# DB file built by the first NCBITaxa for each (dbfile, taxdump_file)
+_NCBI_DBFILES: dict[tuple[Optional[str], Optional[str]], str] = {}
+_NCBI_LOCK = Lock()
+# Per-thread NCBITaxa instances, since sqlite3 connections are thread-bound
+_NCBI_LOCAL = local()
+
+# Upper bound on threads used by build_lineage_map
+_MAX_WORKERS = min(8, os.cpu_count() or 1)
+# Shared worker pool; its threads (and their NCBITaxa) live across calls
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = Lock()
+
+# Formatted lineages, keyed by (taxid, dbfile, taxdump_file). Only successful
+# lookups are stored, so transient DB errors are retried rather than persisted.
+_LINEAGE_CACHE: dict[tuple[int, Optional[str], Optional[str]], str] = {}
+
+# Taxonomy DB (path, mtime) behind each (dbfile, taxdump_file) group of a
+# loaded cache file, used to stamp those entries again on save
+_CACHE_DB_STAMPS: dict[tuple[Optional[str], Optional[str]], tuple[str, float]] = {}
+
+# If set, the lineage cache is loaded from and saved to this file
+CACHE_ENV_VAR = "BUILD_TAXA_LINEAGE_CACHE"
+
+
+def _get_ncbi(
+    dbfile: Optional[str] = None, taxdump_file: Optional[str] = None
+) -> NCBITaxa:
+    """Return a cached NCBITaxa instance for the calling thread.
+
+    The taxonomy DB is built (if needed) only by the first instance; other
+    threads reuse the same DB file through their own connection.
+    """
+    key = (dbfile, taxdump_file)
+    instances = getattr(_NCBI_LOCAL, "instances", None)
+    if instances is None:
+        instances = _NCBI_LOCAL.instances = {}
+
+    ncbi = instances.get(key)
+    if ncbi is None:
+        with _NCBI_LOCK:
+            built_dbfile = _NCBI_DBFILES.get(key)
+            if built_dbfile is None:
+                ncbi = NCBITaxa(dbfile=dbfile, taxdump_file=taxdump_file)
+                _NCBI_DBFILES[key] = ncbi.dbfile
+            else:
+                ncbi = NCBITaxa(dbfile=built_dbfile, update=False)
+        instances[key] = ncbi
+    return ncbi
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Return the shared thread pool, creating it on first use."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=_MAX_WORKERS, thread_name_prefix="build_taxa_lineage"
+            )
+    return _EXECUTOR
+
+
+def _reset_after_fork() -> None:
+    """Drop the thread pool, DB connections and locks inherited over fork.
+
+    The child has none of the parent's worker threads, so the copied
+    executor would wait forever; sqlite connections must not be shared
+    across processes either. The built DB file paths stay valid.
+    """
+    global _EXECUTOR, _EXECUTOR_LOCK, _NCBI_LOCAL, _NCBI_LOCK
+    _EXECUTOR = None
+    _EXECUTOR_LOCK = Lock()
+    _NCBI_LOCAL = local()
+    _NCBI_LOCK = Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _is_sentinel(taxid: Optional[int]) -> bool:
+    """True for missing/placeholder taxids (None, NaN, -1 from fillna) and 0/1 (root).
+
+    Values that are not integers (e.g. "562") are left for ete4 to convert or
+    reject inside the normal error handling.
+    """
+    if taxid is None:
+        return True
+    try:
+        if taxid != taxid:  # NaN
+            return True
+    except TypeError:  # pd.NA has no truth value
+        return True
+    try:
+        return int(taxid) <= 1
+    except (TypeError, ValueError):
+        return False
+
 
-@lru_cache(maxsize=None)
 def build_lineage(
     taxid: int, dbfile: Optional[str] = None, taxdump_file: Optional[str] = None
 ) -> Optional[str]:
     """Return formatted taxonomic lineage for a single taxid."""
+    if _is_sentinel(taxid):
+        return None
+
+    key = (taxid, dbfile, taxdump_file)
+    if key in _LINEAGE_CACHE:
+        return _LINEAGE_CACHE[key]
+
     try:
-        ncbi = NCBITaxa(dbfile=dbfile, taxdump_file=taxdump_file)
+        ncbi = _get_ncbi(dbfile, taxdump_file)
         lineage = ncbi.get_lineage(taxid)
-        names = ncbi.get_taxid_translator(lineage)
         ranks = ncbi.get_rank(lineage)
+        kept = [tid for tid in lineage if ranks.get(tid) in rank_prefix]
+        names = ncbi.get_taxid_translator(kept)
 
         lineage_parts = [
-            f"{rank_prefix[ranks[tid]]}__{names[tid].replace(' ', '_')}"
-            for tid in lineage
-            if ranks.get(tid) in rank_prefix
+            _PREFIX_SEP[ranks[tid]] + names[tid].translate(_SPACE_TABLE)
+            for tid in kept
         ]
 
-        return "|".join(lineage_parts)
+        result = "|".join(lineage_parts)
 
     except Exception as e:
-        print(f"[ERROR] TaxID {taxid}: {e}")
+        log.warning("taxid %s failed: %s", taxid, e)
         return None
 
+    _LINEAGE_CACHE[key] = result
+    return result
+
+
+def clear_lineage_cache() -> None:
+    """Drop all cached lineages built by build_lineage."""
+    _LINEAGE_CACHE.clear()
+
+
+def _db_stamp(
+    group: tuple[Optional[str], Optional[str]],
+) -> Optional[tuple[str, float]]:
+    """Return (path, mtime) of the taxonomy DB behind a cache group, if known."""
+    db_path = _NCBI_DBFILES.get(group)
+    if db_path is None:
+        stamp = _CACHE_DB_STAMPS.get(group)
+        if stamp is None:
+            return None
+        db_path = stamp[0]
+    try:
+        return db_path, os.path.getmtime(db_path)
+    except OSError:
+        return None
+
+
+def load_lineage_cache(path: str) -> None:
+    """Merge lineages previously saved with save_lineage_cache into the cache.
+
+    Entries whose taxonomy DB file was modified or removed since they were
+    saved are dropped, so an updated DB is queried afresh.
+    """
+    with open(path, "rb") as fh:
+        saved = pickle.load(fh)
+
+    valid = set()
+    for group, (db_path, mtime) in saved["db_stamps"].items():
+        try:
+            current = os.path.getmtime(db_path)
+        except OSError:
+            continue
+        if current == mtime:
+            _CACHE_DB_STAMPS[group] = (db_path, mtime)
+            valid.add(group)
+
+    _LINEAGE_CACHE.update(
+        (key, lineage)
+        for key, lineage in saved["lineages"].items()
+        if lineage is not None and key[1:] in valid
+    )
+
+
+def save_lineage_cache(path: str) -> None:
+    """Pickle the lineage cache to path, replacing the file atomically.
+
+    Each (dbfile, taxdump_file) group is stamped with its DB file's mtime;
+    groups whose DB file is unknown or missing are not saved.
+    """
+    stamps: dict[tuple[Optional[str], Optional[str]], Optional[tuple[str, float]]] = {}
+    lineages = {}
+    for key, lineage in _LINEAGE_CACHE.items():
+        group = key[1:]
+        if group not in stamps:
+            stamps[group] = _db_stamp(group)
+        if stamps[group] is not None:
+            lineages[key] = lineage
+    saved = {
+        "db_stamps": {group: stamp for group, stamp in stamps.items() if stamp},
+        "lineages": lineages,
+    }
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump(saved, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 
 def build_lineage_map(
     taxids: list[int], dbfile: Optional[str] = None, taxdump_file: Optional[str] = None
 ) -> dict[int, Optional[str]]:
-    """Build a lineage dictionary for a list of taxids."""
-    ncbi = NCBITaxa(dbfile=dbfile, taxdump_file=taxdump_file)
-    lineage_map = {}
+    """Build a lineage dictionary for a list of taxids.
 
-    for taxid in taxids:
-        try:
-            lineage = ncbi.get_lineage(taxid)
-            names = ncbi.get_taxid_translator(lineage)
-            ranks = ncbi.get_rank(lineage)
+    Duplicate taxids are looked up once and results are shared with the
+    build_lineage cache. Lineages are resolved per taxid on a thread pool,
+    then ranks for every node across all lineages and names for the nodes
+    at a kept rank are fetched in one batched query each.
+    """
+    lineage_map: dict[int, Optional[str]] = {}
+    lineages: dict[int, list[int]] = {}
+    unique_ids: set[int] = set()
 
-            lineage_parts = [
-                f"{rank_prefix[ranks[tid]]}__{names[tid].replace(' ', '_')}"
-                for tid in lineage
-                if ranks.get(tid) in rank_prefix
-            ]
+    for taxid in set(taxids):
+        key = (taxid, dbfile, taxdump_file)
+        if _is_sentinel(taxid):
+            lineage_map[taxid] = None
+        elif key in _LINEAGE_CACHE:
+            lineage_map[taxid] = _LINEAGE_CACHE[key]
+        else:
+            unique_ids.add(taxid)
 
-            lineage_map[taxid] = "|".join(lineage_parts)
+    def _resolve_one(taxid):
+        try:
+            return taxid, _get_ncbi(dbfile, taxdump_file).get_lineage(taxid)
         except Exception as e:
-            print(f"[WARN] Failed for taxid {taxid}: {e}")
+            log.warning("taxid %s failed: %s", taxid, e)
+            return taxid, None
+
+    for taxid, lineage in _get_executor().map(_resolve_one, unique_ids):
+        if lineage is None:
             lineage_map[taxid] = None
+        else:
+            lineages[taxid] = lineage
+
+    if lineages:
+        try:
+            ncbi = _get_ncbi(dbfile, taxdump_file)
+            all_nodes = set().union(*lineages.values())
+            ranks = ncbi.get_rank(all_nodes)
+            kept_nodes = {tid for tid in all_nodes if ranks.get(tid) in rank_prefix}
+            names = ncbi.get_taxid_translator(kept_nodes)
+        except Exception as e:
+            log.warning("rank/name lookup failed for %d taxids: %s", len(lineages), e)
+            for taxid in lineages:
+                lineage_map[taxid] = None
+            lineages = {}
+
+        for taxid, lineage in lineages.items():
+            try:
+                lineage_parts = [
+                    _PREFIX_SEP[ranks[tid]] + names[tid].translate(_SPACE_TABLE)
+                    for tid in lineage
+                    if tid in kept_nodes
+                ]
+
+                lineage_map[taxid] = "|".join(lineage_parts)
+            except Exception as e:
+                log.warning("taxid %s failed: %s", taxid, e)
+                lineage_map[taxid] = None
+
+    for taxid in unique_ids:
+        lineage = lineage_map[taxid]
+        if lineage is not None:
+            _LINEAGE_CACHE[(taxid, dbfile, taxdump_file)] = lineage
 
     return lineage_map
 
 
+def annotate_dataframe(
+    df,
+    col: str = "ncbi_taxon_id",
+    out: str = "lineage",
+    dbfile: Optional[str] = None,
+    taxdump_file: Optional[str] = None,
+):
+    """Add a lineage column to a pandas DataFrame from its taxid column.
+
+    Unique taxids are resolved once with build_lineage_map and the result is
+    applied with Series.map, avoiding a Python call per row. Values are passed
+    through as-is so the map keys match the column; missing values and ids
+    that cannot be resolved give a missing lineage.
+    """
+    taxids = df[col].dropna().unique().tolist()
+    lineage_map = build_lineage_map(taxids, dbfile=dbfile, taxdump_file=taxdump_file)
+    df[out] = df[col].map(lineage_map)
+    return df
+
+
+def lineages_for(
+    taxids: np.ndarray, dbfile: Optional[str] = None, taxdump_file: Optional[str] = None
+) -> np.ndarray:
+    """Return an object-dtype NumPy array of lineages aligned with taxids.
+
+    Unique taxids are resolved once with build_lineage_map and scattered
+    back to every position with a single take on the inverse indices.
+    Missing values (NaN, None, pd.NA) and unresolvable ids map to None.
+    """
+    taxids = np.asarray(taxids)
+    flat = taxids.ravel()
+    if flat.dtype == object:
+        # np.unique cannot sort mixed objects such as None or pd.NA
+        codes: dict = {}
+        inverse = np.fromiter(
+            (codes.setdefault(taxid, len(codes)) for taxid in flat),
+            dtype=np.intp,
+            count=len(flat),
+        )
+        unique_ids = list(codes)
+    else:
+        unique, inverse = np.unique(flat, return_inverse=True)
+        unique_ids = unique.tolist()
+    lineage_map = build_lineage_map(unique_ids, dbfile=dbfile, taxdump_file=taxdump_file)
+
+    values = np.empty(len(unique_ids), dtype=object)
+    values[:] = [lineage_map.get(taxid) for taxid in unique_ids]
+    return values.take(inverse).reshape(taxids.shape)
+
+
+def _save_cache_at_exit(path: str) -> None:
+    """atexit hook: save the cache, warning instead of raising on I/O errors."""
+    try:
+        save_lineage_cache(path)
+    except OSError as e:
+        log.warning("could not save lineage cache to %s: %s", path, e)
+
+
+_cache_path = os.environ.get(CACHE_ENV_VAR)
+if _cache_path:
+    if os.path.exists(_cache_path):
+        try:
+            load_lineage_cache(_cache_path)
+        except Exception as e:
+            log.warning("ignoring unreadable lineage cache %s: %s", _cache_path, e)
+    atexit.register(_save_cache_at_exit, _cache_path)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Annotate a CSV/TSV file with lineages, reading and writing it in chunks.
+
+    Entry point of the build-taxa-lineage console script. The output is
+    written to a temporary file and only moved into place on success.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Add a taxonomic lineage column to a CSV/TSV file."
+    )
+    parser.add_argument("--in", dest="in_file", required=True, help="input file")
+    parser.add_argument("--out", dest="out_file", required=True, help="output file")
+    parser.add_argument("--col", default="ncbi_taxon_id", help="taxid column")
+    parser.add_argument("--sep", default="\t", help="field separator (default: tab)")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="rows per chunk")
+    parser.add_argument("--dbfile", default=None, help="NCBI taxonomy sqlite DB")
+    parser.add_argument(
+        "--taxdump-file", default=None, help="NCBI taxdump.tar.gz to build the DB from"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        import pandas as pd
+    except ImportError:
+        parser.error("pandas is required: pip install 'build-taxa-lineage[cli]'")
+
+    sep = "\t" if args.sep == "\\t" else args.sep
+    columns = pd.read_csv(args.in_file, sep=sep, nrows=0).columns
+    if args.col not in columns:
+        parser.error(
+            f"column {args.col!r} not found in {args.in_file} "
+            f"(columns: {', '.join(map(str, columns))})"
+        )
+
+    # Read taxids as text: ete4 converts "562" itself, bad cells are logged
+    # as failed lookups instead of aborting the stream, and ids are written
+    # back exactly as they were read
+    reader = pd.read_csv(
+        args.in_file, sep=sep, chunksize=args.chunksize, dtype={args.col: str}
+    )
+    out_dir = os.path.dirname(os.path.abspath(args.out_file))
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="") as out_handle:
+            for i, chunk in enumerate(reader):
+                chunk = annotate_dataframe(
+                    chunk,
+                    col=args.col,
+                    dbfile=args.dbfile,
+                    taxdump_file=args.taxdump_file,
+                )
+                chunk.to_csv(out_handle, header=(i == 0), sep=sep, index=False)
+        os.replace(tmp_path, args.out_file)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 if __name__ == "__main__":
-    pass  # Or test/debug code here
+    main()
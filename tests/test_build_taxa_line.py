@@ -0,0 +1,530 @@
+# SPDX-FileCopyrightText: 2025-present vidyasagar0405 <vidyasagar0405@gmail.com>
+#
+# SPDX-License-Identifier: MIT
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from build_taxa_lineage import build_taxa_line
+
+E_COLI = "d__Bacteria|p__Pseudomonadota|c__Gammaproteobacteria|s__Escherichia_coli"
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Give each test its own empty lineage cache."""
+    fresh = {}
+    monkeypatch.setattr(build_taxa_line, "_LINEAGE_CACHE", fresh)
+    monkeypatch.setattr(build_taxa_line, "_CACHE_DB_STAMPS", {})
+    return fresh
+
+
+@pytest.fixture
+def taxa_dbs(monkeypatch, tmp_path):
+    """Register two existing DB files as built for the default and a custom key."""
+    default_db = tmp_path / "taxa.sqlite"
+    custom_db = tmp_path / "custom.sqlite"
+    default_db.write_bytes(b"")
+    custom_db.write_bytes(b"")
+    monkeypatch.setattr(
+        build_taxa_line,
+        "_NCBI_DBFILES",
+        {(None, None): str(default_db), ("custom.sqlite", None): str(custom_db)},
+    )
+    return default_db, custom_db
+
+
+def test_save_load_round_trip(cache, taxa_dbs, tmp_path):
+    cache[(562, None, None)] = E_COLI
+    cache[(562, "custom.sqlite", None)] = E_COLI
+    path = tmp_path / "lineages.pkl"
+
+    build_taxa_line.save_lineage_cache(str(path))
+    build_taxa_line.clear_lineage_cache()
+    assert cache == {}
+
+    build_taxa_line.load_lineage_cache(str(path))
+    assert cache == {
+        (562, None, None): E_COLI,
+        (562, "custom.sqlite", None): E_COLI,
+    }
+
+
+def test_load_drops_entries_for_updated_db(cache, taxa_dbs, tmp_path):
+    default_db, custom_db = taxa_dbs
+    cache[(562, None, None)] = E_COLI
+    cache[(562, "custom.sqlite", None)] = E_COLI
+    path = tmp_path / "lineages.pkl"
+    build_taxa_line.save_lineage_cache(str(path))
+    build_taxa_line.clear_lineage_cache()
+
+    mtime = os.path.getmtime(custom_db)
+    os.utime(custom_db, (mtime + 10, mtime + 10))
+    build_taxa_line.load_lineage_cache(str(path))
+
+    assert cache == {(562, None, None): E_COLI}
+
+
+def test_save_creates_missing_directory(cache, taxa_dbs, tmp_path):
+    cache[(562, None, None)] = E_COLI
+    directory = tmp_path / "missing" / "dir"
+    path = directory / "lineages.pkl"
+
+    build_taxa_line.save_lineage_cache(str(path))
+
+    assert path.exists()
+    assert os.listdir(directory) == ["lineages.pkl"]
+
+
+def test_concurrent_saves_leave_a_readable_cache(cache, taxa_dbs, tmp_path):
+    for taxid in range(2, 2000):
+        cache[(taxid, None, None)] = E_COLI
+    path = tmp_path / "lineages.pkl"
+
+    def save_repeatedly():
+        for _ in range(20):
+            build_taxa_line.save_lineage_cache(str(path))
+
+    workers = [threading.Thread(target=save_repeatedly) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    expected = dict(cache)
+    build_taxa_line.clear_lineage_cache()
+    build_taxa_line.load_lineage_cache(str(path))
+    assert cache == expected
+    assert sorted(os.listdir(tmp_path)) == ["custom.sqlite", "lineages.pkl", "taxa.sqlite"]
+
+
+def test_load_skips_failed_lookups(cache, taxa_dbs, tmp_path):
+    path = tmp_path / "lineages.pkl"
+    cache[(562, None, None)] = E_COLI
+    cache[(12345678, None, None)] = None
+    build_taxa_line.save_lineage_cache(str(path))
+    build_taxa_line.clear_lineage_cache()
+
+    build_taxa_line.load_lineage_cache(str(path))
+
+    assert cache == {(562, None, None): E_COLI}
+
+
+def test_failed_lookup_is_not_cached(cache, monkeypatch):
+    def broken_ncbi(*args):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(build_taxa_line, "_get_ncbi", broken_ncbi)
+
+    assert build_taxa_line.build_lineage(562) is None
+    assert build_taxa_line.build_lineage_map([562]) == {562: None}
+    assert cache == {}
+
+
+def test_corrupt_cache_file_does_not_break_import(tmp_path):
+    path = tmp_path / "lineages.pkl"
+    path.write_bytes(b"not a pickle")
+    env = dict(os.environ)
+    env[build_taxa_line.CACHE_ENV_VAR] = str(path)
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+
+    proc = subprocess.run(
+        [sys.executable, "-c", "import build_taxa_lineage"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+
+    assert proc.returncode == 0, proc.stderr
+    assert "ignoring unreadable lineage cache" in proc.stderr
+
+
+class FakeNCBI:
+    """Minimal stand-in for NCBITaxa over a tiny E. coli lineage.
+
+    Every query is recorded in ``calls`` as ``(method, argument)``.
+    """
+
+    taxa = {
+        1: (None, "no rank", "root"),
+        2: (1, "domain", "Bacteria"),
+        1224: (2, "phylum", "Pseudomonadota"),
+        1236: (1224, "class", "Gammaproteobacteria"),
+        562: (1236, "species", "Escherichia coli"),
+    }
+
+    def __init__(self, *args, **kwargs):
+        self.calls = []
+
+    def get_lineage(self, taxid):
+        self.calls.append(("get_lineage", taxid))
+        taxid = int(taxid)
+        if taxid not in self.taxa:
+            raise ValueError(f"Could not find taxid: {taxid}")
+        lineage = []
+        while taxid:
+            lineage.append(taxid)
+            taxid = self.taxa[taxid][0]
+        return lineage[::-1]
+
+    def get_rank(self, taxids):
+        self.calls.append(("get_rank", set(taxids)))
+        return {t: self.taxa[t][1] for t in taxids if t in self.taxa}
+
+    def get_taxid_translator(self, taxids):
+        self.calls.append(("get_taxid_translator", set(taxids)))
+        return {t: self.taxa[t][2] for t in taxids if t in self.taxa}
+
+
+@pytest.fixture
+def fake_ncbi(monkeypatch):
+    """Route every lookup to one shared FakeNCBI and return it."""
+    ncbi = FakeNCBI()
+    monkeypatch.setattr(build_taxa_line, "_get_ncbi", lambda *args: ncbi)
+    return ncbi
+
+
+def _methods(ncbi):
+    return [method for method, _ in ncbi.calls]
+
+
+def test_lineage_map_batches_rank_and_name_queries(cache, fake_ncbi):
+    lineage_map = build_taxa_line.build_lineage_map([562, 1236, 1224])
+
+    assert lineage_map[562] == E_COLI
+    assert lineage_map[1236] == "d__Bacteria|p__Pseudomonadota|c__Gammaproteobacteria"
+    assert _methods(fake_ncbi).count("get_rank") == 1
+    assert _methods(fake_ncbi).count("get_taxid_translator") == 1
+
+
+def test_lineage_map_looks_up_duplicates_once(cache, fake_ncbi):
+    lineage_map = build_taxa_line.build_lineage_map([562, 1236, 562, 562, 1236])
+
+    assert set(lineage_map) == {562, 1236}
+    lookups = [arg for method, arg in fake_ncbi.calls if method == "get_lineage"]
+    assert sorted(lookups) == [562, 1236]
+
+
+def test_names_only_requested_for_kept_ranks(cache, fake_ncbi):
+    build_taxa_line.build_lineage(562)
+    build_taxa_line.build_lineage_map([1236])
+
+    translated = [arg for method, arg in fake_ncbi.calls if method == "get_taxid_translator"]
+    assert translated == [{2, 1224, 1236, 562}, {2, 1224, 1236}]
+
+
+def test_spaces_in_names_become_underscores(cache, fake_ncbi):
+    fake_ncbi.taxa = {
+        **FakeNCBI.taxa,
+        83333: (1236, "species", "Escherichia coli str. K-12 substr. MG1655"),
+    }
+    expected = (
+        "d__Bacteria|p__Pseudomonadota|c__Gammaproteobacteria|"
+        "s__Escherichia_coli_str._K-12_substr._MG1655"
+    )
+
+    assert build_taxa_line.build_lineage(83333) == expected
+    build_taxa_line.clear_lineage_cache()
+    assert build_taxa_line.build_lineage_map([83333]) == {83333: expected}
+
+
+def test_lineage_map_survives_failing_batch_query(cache, fake_ncbi, monkeypatch):
+    def locked(taxids):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(fake_ncbi, "get_rank", locked)
+
+    assert build_taxa_line.build_lineage_map([562, 1236]) == {562: None, 1236: None}
+    assert cache == {}
+
+
+@pytest.fixture
+def patched_ncbitaxa(monkeypatch):
+    """Patch NCBITaxa itself so the real _get_ncbi and thread pool run.
+
+    Returns the list of opened instances, each recording its constructor
+    arguments and the thread that opened it.
+    """
+    opened = []
+
+    class RecordingNCBI(FakeNCBI):
+        def __init__(self, dbfile=None, taxdump_file=None, update=True):
+            super().__init__()
+            self.dbfile = dbfile or "taxa.sqlite"
+            self.taxdump_file = taxdump_file
+            self.update = update
+            self.thread = threading.get_ident()
+            opened.append(self)
+
+    monkeypatch.setattr(build_taxa_line, "NCBITaxa", RecordingNCBI)
+    monkeypatch.setattr(build_taxa_line, "_NCBI_DBFILES", {})
+    monkeypatch.setattr(build_taxa_line, "_NCBI_LOCAL", threading.local())
+    monkeypatch.setattr(build_taxa_line, "_EXECUTOR", None)
+    yield opened
+    if build_taxa_line._EXECUTOR is not None:
+        build_taxa_line._EXECUTOR.shutdown()
+
+
+def test_get_ncbi_one_instance_per_thread(patched_ncbitaxa):
+    first = build_taxa_line._get_ncbi(None, "taxdump.tar.gz")
+    assert build_taxa_line._get_ncbi(None, "taxdump.tar.gz") is first
+
+    result = []
+    worker = threading.Thread(
+        target=lambda: result.append(build_taxa_line._get_ncbi(None, "taxdump.tar.gz"))
+    )
+    worker.start()
+    worker.join()
+
+    other = result[0]
+    assert other is not first
+    assert (first.taxdump_file, first.update) == ("taxdump.tar.gz", True)
+    assert (other.dbfile, other.taxdump_file, other.update) == (
+        first.dbfile,
+        None,
+        False,
+    )
+    assert patched_ncbitaxa == [first, other]
+
+
+def test_thread_pool_reuses_worker_connections(cache, patched_ncbitaxa):
+    ids = [562, 1236, 1224, 2]
+    build_taxa_line.build_lineage_map(ids)
+    opened_first_call = len(patched_ncbitaxa)
+
+    build_taxa_line.clear_lineage_cache()
+    assert build_taxa_line.build_lineage_map(ids)[562] == E_COLI
+
+    first = patched_ncbitaxa[0]
+    assert len(patched_ncbitaxa) == opened_first_call
+    assert len({ncbi.thread for ncbi in patched_ncbitaxa}) == len(patched_ncbitaxa)
+    for ncbi in patched_ncbitaxa[1:]:
+        assert (ncbi.dbfile, ncbi.update) == (first.dbfile, False)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_lineage_map_works_after_fork(cache, patched_ncbitaxa):
+    assert build_taxa_line.build_lineage_map([562]) == {562: E_COLI}
+    build_taxa_line.clear_lineage_cache()
+
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            ok = build_taxa_line.build_lineage_map([562]) == {562: E_COLI}
+        finally:
+            os._exit(0 if ok else 1)
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            assert os.waitstatus_to_exitcode(status) == 0
+            return
+        time.sleep(0.05)
+    os.kill(pid, 9)
+    os.waitpid(pid, 0)
+    pytest.fail("build_lineage_map hung in the forked child")
+
+
+@pytest.mark.parametrize("taxid", [None, float("nan"), -1, 0, 1])
+def test_sentinel_taxids_return_none(cache, fake_ncbi, taxid):
+    assert build_taxa_line.build_lineage(taxid) is None
+    assert build_taxa_line.build_lineage_map([taxid]) == {taxid: None}
+    assert fake_ncbi.calls == []
+
+
+def test_failures_are_logged_and_can_be_silenced(cache, fake_ncbi, caplog):
+    caplog.set_level(logging.WARNING)
+
+    assert build_taxa_line.build_lineage(99999999) is None
+    assert build_taxa_line.build_lineage_map([88888888]) == {88888888: None}
+    assert [(r.name, r.levelno) for r in caplog.records] == [
+        ("build_taxa_lineage.build_taxa_line", logging.WARNING),
+        ("build_taxa_lineage.build_taxa_line", logging.WARNING),
+    ]
+    assert "taxid 99999999 failed" in caplog.records[0].getMessage()
+
+    caplog.clear()
+    package_logger = logging.getLogger("build_taxa_lineage")
+    package_logger.setLevel(logging.CRITICAL)
+    try:
+        build_taxa_line.build_lineage(99999999)
+        build_taxa_line.build_lineage_map([88888888])
+    finally:
+        package_logger.setLevel(logging.NOTSET)
+    assert caplog.records == []
+
+
+def test_non_int_taxids_do_not_raise(cache, fake_ncbi):
+    assert build_taxa_line.build_lineage("562") == E_COLI
+    assert build_taxa_line.build_lineage_map(["562"]) == {"562": E_COLI}
+    assert build_taxa_line.build_lineage("abc") is None
+    assert build_taxa_line.build_lineage_map(["abc"]) == {"abc": None}
+
+
+@pytest.mark.parametrize(
+    "values, dtype",
+    [
+        ([562.0, float("nan"), 562.0], "float64"),
+        ([562, None, 562], "Int64"),
+        (["562", None, "562"], "object"),
+    ],
+)
+def test_annotate_dataframe_column_types(cache, fake_ncbi, values, dtype):
+    pd = pytest.importorskip("pandas")
+    df = pd.DataFrame({"ncbi_taxon_id": pd.Series(values, dtype=dtype)})
+
+    out = build_taxa_line.annotate_dataframe(df)
+
+    assert out["lineage"].tolist()[0] == E_COLI
+    assert out["lineage"].tolist()[2] == E_COLI
+    assert pd.isna(out["lineage"].tolist()[1])
+
+
+def test_annotate_dataframe_unresolvable_id(cache, fake_ncbi):
+    pd = pytest.importorskip("pandas")
+    df = pd.DataFrame({"taxid": ["562", "abc"]})
+
+    out = build_taxa_line.annotate_dataframe(df, col="taxid", out="lin")
+
+    assert out["lin"].tolist()[0] == E_COLI
+    assert pd.isna(out["lin"].tolist()[1])
+
+
+C_GAMMA = "d__Bacteria|p__Pseudomonadota|c__Gammaproteobacteria"
+
+
+@pytest.mark.parametrize(
+    "taxids, expected",
+    [
+        (np.array([562, 1236, 562, -1]), [E_COLI, C_GAMMA, E_COLI, None]),
+        (np.array([562.0, np.nan, 1236.0, np.nan]), [E_COLI, None, C_GAMMA, None]),
+        (np.array([562, None, 562], dtype=object), [E_COLI, None, E_COLI]),
+        (np.array(["562", "abc", "562"], dtype=object), [E_COLI, None, E_COLI]),
+        (np.array(["562", "abc"]), [E_COLI, None]),
+        (np.array([], dtype=float), []),
+    ],
+)
+def test_lineages_for(cache, fake_ncbi, taxids, expected):
+    result = build_taxa_line.lineages_for(taxids)
+
+    assert result.dtype == object
+    assert result.shape == taxids.shape
+    assert result.tolist() == expected
+
+
+def test_lineages_for_pandas_missing_values(cache, fake_ncbi):
+    pd = pytest.importorskip("pandas")
+    int64 = pd.Series([562, None, 1236], dtype="Int64").to_numpy()
+    with_na = np.array([562, pd.NA], dtype=object)
+
+    assert build_taxa_line.lineages_for(int64).tolist() == [E_COLI, None, C_GAMMA]
+    assert build_taxa_line.lineages_for(with_na).tolist() == [E_COLI, None]
+
+
+def test_lineages_for_keeps_2d_shape(cache, fake_ncbi):
+    result = build_taxa_line.lineages_for(np.array([[562, 1236], [1236, -1]]))
+
+    assert result.shape == (2, 2)
+    assert result.tolist() == [[E_COLI, C_GAMMA], [C_GAMMA, None]]
+
+
+def test_cli_annotates_file_in_chunks(cache, fake_ncbi, tmp_path):
+    pytest.importorskip("pandas")
+    in_file = tmp_path / "in.tsv"
+    out_file = tmp_path / "out.tsv"
+    in_file.write_text("id\tncbi_taxon_id\na\t562\nb\t\nc\t562\n")
+
+    build_taxa_line.main(
+        ["--in", str(in_file), "--out", str(out_file), "--chunksize", "2"]
+    )
+
+    assert out_file.read_text().splitlines() == [
+        "id\tncbi_taxon_id\tlineage",
+        f"a\t562\t{E_COLI}",
+        "b\t\t",
+        f"c\t562\t{E_COLI}",
+    ]
+
+
+def test_cli_keeps_bad_ids_and_formatting(cache, fake_ncbi, tmp_path):
+    pytest.importorskip("pandas")
+    in_file = tmp_path / "in.tsv"
+    out_file = tmp_path / "out.tsv"
+    in_file.write_text("id\tncbi_taxon_id\na\t562\nb\tabc\nc\t\nd\t0562\n")
+
+    build_taxa_line.main(
+        ["--in", str(in_file), "--out", str(out_file), "--chunksize", "1"]
+    )
+
+    assert out_file.read_text().splitlines() == [
+        "id\tncbi_taxon_id\tlineage",
+        f"a\t562\t{E_COLI}",
+        "b\tabc\t",
+        "c\t\t",
+        f"d\t0562\t{E_COLI}",
+    ]
+
+
+def test_cli_failure_leaves_no_output(cache, fake_ncbi, tmp_path, monkeypatch):
+    pytest.importorskip("pandas")
+    in_file = tmp_path / "in.tsv"
+    out_file = tmp_path / "out.tsv"
+    in_file.write_text("id\tncbi_taxon_id\na\t562\nb\t1236\n")
+    annotate = build_taxa_line.annotate_dataframe
+    chunks = []
+
+    def fail_on_second_chunk(chunk, **kwargs):
+        chunks.append(chunk)
+        if len(chunks) == 2:
+            raise RuntimeError("boom")
+        return annotate(chunk, **kwargs)
+
+    monkeypatch.setattr(build_taxa_line, "annotate_dataframe", fail_on_second_chunk)
+
+    with pytest.raises(RuntimeError):
+        build_taxa_line.main(
+            ["--in", str(in_file), "--out", str(out_file), "--chunksize", "1"]
+        )
+
+    assert os.listdir(tmp_path) == ["in.tsv"]
+
+
+def test_cli_passes_taxdump_file(cache, patched_ncbitaxa, tmp_path):
+    pytest.importorskip("pandas")
+    in_file = tmp_path / "in.tsv"
+    in_file.write_text("ncbi_taxon_id\n562\n")
+
+    build_taxa_line.main(
+        [
+            "--in", str(in_file),
+            "--out", str(tmp_path / "out.tsv"),
+            "--dbfile", "custom.sqlite",
+            "--taxdump-file", "taxdump.tar.gz",
+        ]
+    )
+
+    first = patched_ncbitaxa[0]
+    assert (first.dbfile, first.taxdump_file) == ("custom.sqlite", "taxdump.tar.gz")
+
+
+def test_cli_reports_unknown_column(tmp_path, capsys):
+    pytest.importorskip("pandas")
+    in_file = tmp_path / "in.tsv"
+    in_file.write_text("id\ttaxid\na\t562\n")
+
+    with pytest.raises(SystemExit) as exc:
+        build_taxa_line.main(
+            ["--in", str(in_file), "--out", str(tmp_path / "out.tsv"), "--col", "nope"]
+        )
+
+    assert exc.value.code == 2
+    assert "column 'nope' not found" in capsys.readouterr().err
+    assert not (tmp_path / "out.tsv").exists()